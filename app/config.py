@@ -7,7 +7,9 @@ class Settings(BaseSettings):
     embed_model: str = "nomic-embed-text"
     ollama_gen_url: str = "http://localhost:11434/api/generate"
     gen_model: str = "llama3.1"
+    ollama_keep_alive: str = "30m"
     db_path: str = "observability.db"
+    archive_path: str = "observability_archive"
 
 
 settings = Settings()
@@ -1,31 +1,55 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import os
+from fastapi import FastAPI, File, HTTPException, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 from contextlib import asynccontextmanager
-from typing import Optional
+from datetime import date
+from pathlib import Path
+from typing import List, Optional
 
-from app.rag.query import rag_query
-from app.observability.db import init_db, insert_feedback
-from app.observability.tracing import setup_tracer
+from app.rag.query import rag_query, readiness, warmup_until_ready
+from app.observability.db import init_db, insert_feedback, fail_unfinished_ingest_jobs
+from app.rag import jobs
+from app.rag.ingest import DATA_DIR, list_pdfs
+# Must be imported at module level: the middleware is added before the app starts
 from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
-from opentelemetry.instrumentation.httpx import HTTPXClientInstrumentor
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Code to be executed at application startup
+    # Code to be executed at application startup.
+    # The heavy backends are imported here rather than at module level to keep cold start fast.
+    from app.observability.tracing import setup_tracer
+    from opentelemetry.instrumentation.httpx import HTTPXClientInstrumentor
+
     init_db()
+    fail_unfinished_ingest_jobs()  # Jobs of a previous run cannot resume
     setup_tracer()  # Set up the OpenTelemetry tracer
     HTTPXClientInstrumentor().instrument()
+    # Warm up in the background, retrying until warm: the API answers right away and /ready reports when it is warm
+    warmup_task = asyncio.create_task(warmup_until_ready())
     yield
-    # Code to be executed at shutdown (not necessary in this case)
+    # Code to be executed at shutdown
+    warmup_task.cancel()
+    jobs.shutdown()
 
 class QueryRequest(BaseModel):
     question: str
+    report_years: Optional[List[int]] = None  # Restricts the search to these report years
+    source_files: Optional[List[str]] = None  # Restricts the search to these PDF files
 
 class RatingRequest(BaseModel):
     request_id: str
     rating: int = Field(..., ge=1, le=5) # Ensures the rating is between 1 and 5
     comment: Optional[str] = None
 
+class IngestFolderRequest(BaseModel):
+    folder: Optional[str] = None  # Subfolder of the FED reports folder to index; defaults to the whole folder
+
+class ExportRequest(BaseModel):
+    since: Optional[date] = None  # First day to export, inclusive
+    until: Optional[date] = None  # Last day to export, inclusive
+
 
 app = FastAPI(title="RAG Observability - v1 demo", lifespan=lifespan)
 FastAPIInstrumentor.instrument_app(app)
@@ -36,9 +60,22 @@ def root():
     return {"status": "ok", "message": "RAG FED reports API v1"}
 
 
+@app.get("/ready")
+def ready(response: Response):
+    # Readiness probe: 503 until the retrieval index and the LLM are warm
+    is_ready = all(readiness.values())
+    if not is_ready:
+        response.status_code = 503
+    return {"ready": is_ready, **readiness}
+
+
 @app.post("/query")
 async def query_endpoint(payload: QueryRequest):
-    result = await rag_query(payload.question)
+    result = await rag_query(
+        payload.question,
+        report_years=payload.report_years,
+        source_files=payload.source_files,
+    )
     return result
 
 @app.post("/rate")
@@ -53,3 +90,55 @@ async def rate_endpoint(payload: RatingRequest):
     except Exception as e:
         # In a real app, we would log the error here
         raise HTTPException(status_code=500, detail=f"Internal error: {e}")
+
+@app.post("/observability/export")
+async def export_endpoint(payload: ExportRequest):
+    # Imported on first use: pyarrow is not needed to serve queries
+    from app.observability.export import export_requests
+
+    # Runs in a worker thread so the export does not block the query path
+    summary = await run_in_threadpool(export_requests, since=payload.since, until=payload.until)
+    return {"status": "ok", **summary}
+
+@app.post("/ingest/jobs", status_code=202)
+def ingest_folder_endpoint(payload: IngestFolderRequest):
+    # Rebuilds the index from DATA_DIR (subfolders included) into a new collection version,
+    # or re-indexes one subfolder while keeping the other reports from the active version
+    pdf_paths = None
+    source = DATA_DIR
+    keep_other_files = False
+    if payload.folder is not None:
+        # Only folders inside DATA_DIR can be indexed, or any file on the host could be exposed through /query
+        data_dir = Path(DATA_DIR).resolve()
+        folder = (data_dir / payload.folder).resolve()
+        if not folder.is_relative_to(data_dir):
+            raise HTTPException(status_code=400, detail=f"Folder must be inside {DATA_DIR}: {payload.folder}")
+        if not folder.is_dir():
+            raise HTTPException(status_code=400, detail=f"Folder not found: {payload.folder}")
+        if folder != data_dir:
+            pdf_paths = list_pdfs(str(folder))
+            source = str(folder)
+            keep_other_files = True
+    job_id = jobs.submit_ingest_job(source=source, pdf_paths=pdf_paths, keep_other_files=keep_other_files)
+    return {"job_id": job_id, "status": "queued"}
+
+@app.post("/ingest/jobs/upload", status_code=202)
+def ingest_upload_endpoint(file: UploadFile = File(...)):
+    # Adds (or replaces) one PDF, keeping the chunks of the other reports from the active version
+    fname = os.path.basename(file.filename or "")
+    if not fname.lower().endswith(".pdf"):
+        raise HTTPException(status_code=400, detail="Only PDF files can be ingested.")
+    # The upload is staged by the job and moved into DATA_DIR only after its version is active
+    job_id = jobs.submit_upload_job(fname, file.file)
+    return {"job_id": job_id, "status": "queued"}
+
+@app.get("/ingest/jobs")
+def list_ingest_jobs_endpoint(limit: int = 20):
+    return jobs.list_jobs(limit=limit)
+
+@app.get("/ingest/jobs/{job_id}")
+def ingest_job_endpoint(job_id: str):
+    job = jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Ingestion job not found: {job_id}")
+    return job
@@ -41,6 +41,10 @@ def init_db():
     _add_column_if_not_exists(cursor, "requests_log", "prompt_tokens", "INTEGER")
     _add_column_if_not_exists(cursor, "requests_log", "answer_tokens", "INTEGER")
     _add_column_if_not_exists(cursor, "requests_log", "trace_id", "TEXT")
+    _add_column_if_not_exists(cursor, "requests_log", "latency_ms_prefill", "INTEGER")
+    _add_column_if_not_exists(cursor, "requests_log", "latency_ms_load", "INTEGER")
+    _add_column_if_not_exists(cursor, "requests_log", "coalesced", "INTEGER DEFAULT 0")
+    _add_column_if_not_exists(cursor, "requests_log", "coalesced_with", "TEXT")
 
     # Crea la tabella di feedback
     cursor.execute("""
@@ -52,6 +56,22 @@ def init_db():
             FOREIGN KEY (request_id) REFERENCES requests_log (request_id)
         )
     """)
+
+    # Crea la tabella dei job di ingestion (started_at/finished_at in secondi epoch)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_jobs (
+            job_id TEXT PRIMARY KEY,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            source TEXT NOT NULL,
+            status TEXT NOT NULL,
+            total_chunks INTEGER,
+            processed_chunks INTEGER DEFAULT 0,
+            started_at REAL,
+            finished_at REAL,
+            collection_name TEXT,
+            error TEXT
+        )
+    """)
     
     conn.commit()
     conn.close()
@@ -61,14 +81,18 @@ def insert_log(
     question: str,
     answer: Optional[str],
     latency_ms_total: int,
-    latency_ms_retrieval: int,
-    latency_ms_llm: int,
+    latency_ms_retrieval: Optional[int],
+    latency_ms_llm: Optional[int],
+    latency_ms_prefill: Optional[int],
+    latency_ms_load: Optional[int],
     retrieved_sources: List[Dict[str, Any]],
     retrieved_distances: Optional[List[float]],
     prompt_tokens: Optional[int],
     answer_tokens: Optional[int],
     error: Optional[str],
-    trace_id: Optional[str]
+    trace_id: Optional[str],
+    coalesced: bool = False,
+    coalesced_with: Optional[str] = None,
 ):
     """Inserisce un record di log nel database."""
     conn = sqlite3.connect(DB_PATH)
@@ -77,9 +101,10 @@ def insert_log(
         """
         INSERT INTO requests_log (
             request_id, question, answer, latency_ms_total, 
-            latency_ms_retrieval, latency_ms_llm, retrieved_sources, 
-            retrieved_distances, prompt_tokens, answer_tokens, error, trace_id
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            latency_ms_retrieval, latency_ms_llm, latency_ms_prefill, latency_ms_load,
+            retrieved_sources, retrieved_distances, prompt_tokens, answer_tokens, error, trace_id,
+            coalesced, coalesced_with
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """,
         (
             request_id,
@@ -88,12 +113,16 @@ def insert_log(
             latency_ms_total,
             latency_ms_retrieval,
             latency_ms_llm,
+            latency_ms_prefill,
+            latency_ms_load,
             json.dumps(retrieved_sources),
             json.dumps(retrieved_distances) if retrieved_distances is not None else None,
             prompt_tokens,
             answer_tokens,
             error,
             trace_id,
+            int(coalesced),
+            coalesced_with,
         ),
     )
     conn.commit()
@@ -114,5 +143,62 @@ def insert_feedback(request_id: str, rating: int, comment: Optional[str]):
     conn.commit()
     conn.close()
 
+INGEST_JOB_FIELDS = (
+    "status", "total_chunks", "processed_chunks", "started_at",
+    "finished_at", "collection_name", "error",
+)
+
+def insert_ingest_job(job_id: str, source: str):
+    """Registra un nuovo job di ingestion in coda."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute(
+        "INSERT INTO ingest_jobs (job_id, source, status) VALUES (?, ?, 'queued')",
+        (job_id, source),
+    )
+    conn.commit()
+    conn.close()
+
+def update_ingest_job(job_id: str, **fields):
+    """Aggiorna lo stato e l'avanzamento di un job di ingestion."""
+    unknown = set(fields) - set(INGEST_JOB_FIELDS)
+    if unknown:
+        raise ValueError(f"Campi non validi per ingest_jobs: {sorted(unknown)}")
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute(
+        f"UPDATE ingest_jobs SET {assignments} WHERE job_id = ?",
+        (*fields.values(), job_id),
+    )
+    conn.commit()
+    conn.close()
+
+def get_ingest_jobs(job_id: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+    """Restituisce un job di ingestion, o gli ultimi `limit` job se `job_id` non è indicato."""
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    if job_id is not None:
+        cursor.execute("SELECT * FROM ingest_jobs WHERE job_id = ?", (job_id,))
+    else:
+        cursor.execute("SELECT * FROM ingest_jobs ORDER BY created_at DESC, rowid DESC LIMIT ?", (limit,))
+    rows = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+    return rows
+
+def fail_unfinished_ingest_jobs():
+    """Segna come falliti i job rimasti in coda o in esecuzione da un avvio precedente."""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        UPDATE ingest_jobs SET status = 'failed', error = 'Interrupted by an API restart'
+        WHERE status IN ('queued', 'running')
+        """
+    )
+    conn.commit()
+    conn.close()
+
 # Esegui l'inizializzazione all'avvio del modulo
 # init_db()
@@ -0,0 +1,161 @@
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from loguru import logger
+
+from app.config import settings
+from app.observability.db import DB_PATH, init_db
+
+ARCHIVE_PATH = Path(settings.archive_path).resolve()
+
+# Columnar schema of the archived requests (with their feedback). Latencies, token
+# counts and distances are native numeric columns instead of TEXT/JSON.
+REQUESTS_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("timestamp", pa.timestamp("s")),
+    ("request_id", pa.string()),
+    ("trace_id", pa.string()),
+    ("question", pa.string()),
+    ("answer", pa.string()),
+    ("latency_ms_total", pa.int32()),
+    ("latency_ms_retrieval", pa.int32()),
+    ("latency_ms_llm", pa.int32()),
+    ("latency_ms_prefill", pa.int32()),
+    ("latency_ms_load", pa.int32()),
+    ("retrieved_sources", pa.string()),
+    ("retrieved_distances", pa.list_(pa.float32())),
+    ("prompt_tokens", pa.int32()),
+    ("answer_tokens", pa.int32()),
+    ("error", pa.string()),
+    ("coalesced", pa.bool_()),
+    ("coalesced_with", pa.string()),
+    ("rating", pa.int8()),
+    ("comment", pa.string()),
+])
+
+_EXPORT_QUERY = """
+    SELECT
+        rl.id, rl.timestamp, rl.request_id, rl.trace_id, rl.question, rl.answer,
+        rl.latency_ms_total, rl.latency_ms_retrieval, rl.latency_ms_llm,
+        rl.latency_ms_prefill, rl.latency_ms_load, rl.retrieved_sources,
+        rl.retrieved_distances, rl.prompt_tokens, rl.answer_tokens, rl.error,
+        rl.coalesced, rl.coalesced_with, rf.rating, rf.comment
+    FROM requests_log rl
+    LEFT JOIN request_feedback rf ON rl.request_id = rf.request_id
+    WHERE (? IS NULL OR date(rl.timestamp) >= ?)
+      AND (? IS NULL OR date(rl.timestamp) <= ?)
+    ORDER BY rl.timestamp, rl.id
+"""
+
+
+def _rows_to_batch(rows: List[tuple]) -> pa.RecordBatch:
+    """Converts SQLite rows to a record batch, decoding the JSON-encoded distances."""
+    columns: Dict[str, List[Any]] = {name: [] for name in REQUESTS_SCHEMA.names}
+    for row in rows:
+        for name, value in zip(REQUESTS_SCHEMA.names, row):
+            if name == "timestamp":
+                value = datetime.fromisoformat(value)
+            elif name == "retrieved_distances":
+                value = json.loads(value) if value else None
+            elif name == "coalesced":
+                value = bool(value)
+            columns[name].append(value)
+    return pa.RecordBatch.from_pydict(columns, schema=REQUESTS_SCHEMA)
+
+
+def _partition_dir(archive_path: Path, day: str) -> Path:
+    """Returns the hive-style partition directory for a day."""
+    return archive_path / "requests_log" / f"date={day}"
+
+
+def export_requests(
+    archive_path: Path = ARCHIVE_PATH,
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    batch_size: int = 5000,
+) -> Dict[str, Any]:
+    """
+    Streams `requests_log` (joined with its feedback) into zstd-compressed Parquet files
+    partitioned by day. Rows are read in batches of `batch_size`, so memory use does not
+    grow with the size of the log. Re-exporting a day replaces its partition.
+    """
+    since_str = since.isoformat() if since else None
+    until_str = until.isoformat() if until else None
+    logger.info(f"Exporting requests_log to {archive_path} (since={since_str}, until={until_str})...")
+
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute(_EXPORT_QUERY, (since_str, since_str, until_str, until_str))
+
+    writer: Optional[pq.ParquetWriter] = None
+    current_day: Optional[str] = None
+    tmp_file: Optional[Path] = None
+    days: List[str] = []
+    total_rows = 0
+
+    def _close_partition():
+        # The partition is written under a temporary name and renamed once complete
+        if writer is not None:
+            writer.close()
+            os.replace(tmp_file, tmp_file.with_name("part-0.parquet"))
+
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            batch = _rows_to_batch(rows)
+            # Rows are ordered by timestamp, so each day is a contiguous slice of the stream
+            row_days = [row[1][:10] for row in rows]
+            start = 0
+            while start < len(rows):
+                day = row_days[start]
+                end = start
+                while end < len(rows) and row_days[end] == day:
+                    end += 1
+                if day != current_day:
+                    _close_partition()
+                    partition = _partition_dir(archive_path, day)
+                    partition.mkdir(parents=True, exist_ok=True)
+                    # A unique temp name per run, so overlapping exports of a day never share a file
+                    fd, tmp_name = tempfile.mkstemp(dir=partition, prefix=".part-0.", suffix=".tmp")
+                    os.close(fd)
+                    tmp_file = Path(tmp_name)
+                    writer = pq.ParquetWriter(tmp_file, REQUESTS_SCHEMA, compression="zstd")
+                    current_day = day
+                    days.append(day)
+                writer.write_batch(batch.slice(start, end - start))
+                start = end
+            total_rows += len(rows)
+        _close_partition()
+    except BaseException:
+        # Do not leave a half-written partition behind; the previous export of the day is kept
+        if writer is not None:
+            writer.close()
+        if tmp_file is not None and tmp_file.exists():
+            tmp_file.unlink()
+        raise
+    finally:
+        conn.close()
+
+    logger.info(f"Exported {total_rows} requests into {len(days)} daily partitions.")
+    return {"rows": total_rows, "partitions": days, "archive_path": str(archive_path)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the observability database to a Parquet archive.")
+    parser.add_argument("--since", type=date.fromisoformat, help="First day to export (YYYY-MM-DD)")
+    parser.add_argument("--until", type=date.fromisoformat, help="Last day to export (YYYY-MM-DD)")
+    parser.add_argument("--archive-path", type=Path, default=ARCHIVE_PATH)
+    args = parser.parse_args()
+
+    init_db()
+    export_requests(args.archive_path, since=args.since, until=args.until)
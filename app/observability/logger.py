@@ -10,13 +10,17 @@ class RequestLogEntry(BaseModel):
     question: str
     answer: Optional[str] = None
     latency_ms_total: int = 0
-    latency_ms_retrieval: int = 0
-    latency_ms_llm: int = 0
+    latency_ms_retrieval: Optional[int] = 0
+    latency_ms_llm: Optional[int] = 0
+    latency_ms_prefill: Optional[int] = None
+    latency_ms_load: Optional[int] = None
     retrieved_sources: List[Dict[str, Any]] = []
     retrieved_distances: Optional[List[float]] = None
     prompt_tokens: Optional[int] = None
     answer_tokens: Optional[int] = None
     error: Optional[str] = None
+    coalesced: bool = False
+    coalesced_with: Optional[str] = None  # request_id of the request whose pipeline run was shared
 
 def log_request(log_entry: RequestLogEntry):
     """Registra i dettagli di una richiesta nel database."""
@@ -27,10 +31,14 @@ def log_request(log_entry: RequestLogEntry):
         latency_ms_total=log_entry.latency_ms_total,
         latency_ms_retrieval=log_entry.latency_ms_retrieval,
         latency_ms_llm=log_entry.latency_ms_llm,
+        latency_ms_prefill=log_entry.latency_ms_prefill,
+        latency_ms_load=log_entry.latency_ms_load,
         retrieved_sources=log_entry.retrieved_sources,
         retrieved_distances=log_entry.retrieved_distances,
         prompt_tokens=log_entry.prompt_tokens,
         answer_tokens=log_entry.answer_tokens,
         error=log_entry.error,
         trace_id=log_entry.trace_id,
+        coalesced=log_entry.coalesced,
+        coalesced_with=log_entry.coalesced_with,
     )
@@ -1,41 +1,88 @@
 import os
 import re
-from typing import List
+import threading
+import time
+from bisect import bisect_right
+from concurrent.futures import Executor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: il lock vale solo all'interno del processo
+    fcntl = None
 
-import chromadb
-import httpx
-import fitz  # PyMuPDF
 from loguru import logger
 
-CHROMA_PATH = "chroma_db"
+from app.config import settings
+from app.rag.utils import (
+    COLLECTION_NAME,
+    active_collection_name,
+    extract_years,
+    set_active_collection,
+)
+
 DATA_DIR = "./app/data/fed_reports"
 
-OLLAMA_EMBED_URL = "http://localhost:11434/api/embed"
-EMBED_MODEL = "nomic-embed-text"  # modello di embedding che hai già in Ollama
+# File di lock, nella cartella di Chroma, condiviso da tutti i processi che ingeriscono
+VERSION_LOCK_FILE = "ingest.lock"
+_thread_lock = threading.Lock()
 
 
-def extract_pdf_text(path: str) -> str:
-    """Estrae il testo da un PDF usando PyMuPDF (fitz) e pulisce i caratteri problematici."""
+@contextmanager
+def _version_lock():
+    """Serializza le ingestion tra thread e tra processi (job dell'API e CLI) con un file lock."""
+    with _thread_lock:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(settings.chroma_path, exist_ok=True)
+        with open(os.path.join(settings.chroma_path, VERSION_LOCK_FILE), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _clean_page_text(text: str) -> str:
+    """Pulisce i caratteri problematici dal testo di una pagina."""
+    # Sostituisce il non-breaking space con uno spazio normale
+    text = text.replace('\xa0', ' ')
+    # Sostituisce sequenze di due o più punti con uno spazio
+    return re.sub(r'\.{2,}', ' ', text)
+
+
+def extract_pdf_pages(path: str) -> Tuple[List[str], Dict[str, Any]]:
+    """Estrae il testo pagina per pagina da un PDF, insieme al titolo e all'indice (TOC) del documento."""
+    import fitz  # PyMuPDF, importato solo quando serve per velocizzare l'avvio
+
     doc = fitz.open(path)
     pages_text: List[str] = []
     for page in doc:
         try:
-            text = page.get_text() or ""
-            # Sostituisce il non-breaking space con uno spazio normale
-            text = text.replace('\xa0', ' ')
-            # Sostituisce sequenze di due o più punti con uno spazio
-            text = re.sub(r'\.{2,}', ' ', text)
-            pages_text.append(text)
+            pages_text.append(_clean_page_text(page.get_text() or ""))
         except Exception as e:
             logger.warning(f"Errore estraendo testo da {path}, pagina {page.number}: {e}")
             pages_text.append("")
+    info = {
+        "title": (doc.metadata or {}).get("title") or "",
+        # Voci dell'indice come (pagina, titolo), con pagine numerate da 1
+        "toc": [(page_no, title.strip()) for _, title, page_no in doc.get_toc() if title.strip()],
+    }
     doc.close()
+    return pages_text, info
+
+
+def extract_pdf_text(path: str) -> str:
+    """Estrae il testo da un PDF usando PyMuPDF (fitz) e pulisce i caratteri problematici."""
+    pages_text, _ = extract_pdf_pages(path)
     return "\n".join(pages_text)
 
 
-def chunk_text(text: str, chunk_size: int = 1200, overlap: int = 200) -> List[str]:
-    """Spezzetta il testo in chunk con overlap."""
-    chunks: List[str] = []
+def chunk_spans(text: str, chunk_size: int = 1200, overlap: int = 200) -> List[Tuple[int, str]]:
+    """Spezzetta il testo in chunk con overlap, restituendo anche l'offset iniziale di ciascun chunk."""
+    spans: List[Tuple[int, str]] = []
     start = 0
     text_len = len(text)
 
@@ -43,15 +90,41 @@ def chunk_text(text: str, chunk_size: int = 1200, overlap: int = 200) -> List[st
         end = start + chunk_size
         chunk = text[start:end]
         if chunk.strip():
-            chunks.append(chunk)
+            spans.append((start, chunk))
         start = end - overlap
 
-    return chunks
+    return spans
+
+
+def chunk_text(text: str, chunk_size: int = 1200, overlap: int = 200) -> List[str]:
+    """Spezzetta il testo in chunk con overlap."""
+    return [chunk for _, chunk in chunk_spans(text, chunk_size, overlap)]
+
+
+def detect_report_year(fname: str, title: str = "") -> Optional[int]:
+    """Ricava l'anno del report dal nome del file o, in mancanza, dal titolo del PDF."""
+    for candidate in (fname, title):
+        years = extract_years(candidate)
+        if years:
+            return years[0]
+    return None
+
+
+def section_for_page(toc: List[Tuple[int, str]], page: int) -> str:
+    """Restituisce il titolo dell'ultima voce dell'indice che inizia prima o sulla pagina data."""
+    section = ""
+    for toc_page, title in toc:
+        if toc_page > page:
+            break
+        section = title
+    return section
 
 
 def embed_chunks(chunks: List[str], batch_size: int = 32) -> List[List[float]]:
     """Calcola gli embedding per una lista di chunk usando Ollama, in batch."""
-    logger.info(f"Calcolo embedding per {len(chunks)} chunk con {EMBED_MODEL}...")
+    import httpx
+
+    logger.info(f"Calcolo embedding per {len(chunks)} chunk con {settings.embed_model}...")
     all_embeddings: List[List[float]] = []
     
     with httpx.Client() as client:
@@ -60,8 +133,8 @@ def embed_chunks(chunks: List[str], batch_size: int = 32) -> List[List[float]]:
             logger.info(f"Processo batch {i // batch_size + 1}/{(len(chunks) + batch_size - 1) // batch_size}...")
             
             resp = client.post(
-                OLLAMA_EMBED_URL,
-                json={"model": EMBED_MODEL, "input": batch},
+                settings.ollama_embed_url,
+                json={"model": settings.embed_model, "input": batch},
                 timeout=600,
             )
             resp.raise_for_status()
@@ -84,61 +157,185 @@ def embed_chunks(chunks: List[str], batch_size: int = 32) -> List[List[float]]:
     return all_embeddings
 
 
-def ingest_documents():
-    """Ingerisce i PDF in data/fed_reports, crea chunk, calcola embedding e li salva in Chroma."""
-    logger.info("Inizio ingestion dei documenti FED...")
+def list_pdfs(folder: str) -> List[str]:
+    """Elenca i PDF di una cartella e delle sue sottocartelle (escluse quelle nascoste), in ordine."""
+    pdf_paths: List[str] = []
+    for root, dirs, files in os.walk(folder):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        pdf_paths.extend(
+            os.path.join(root, fname) for fname in sorted(files) if fname.lower().endswith(".pdf")
+        )
+    return pdf_paths
 
-    if not os.path.isdir(DATA_DIR):
-        raise FileNotFoundError(f"Cartella dati non trovata: {DATA_DIR}")
 
-    # Prepara client Chroma
-    client = chromadb.PersistentClient(path=CHROMA_PATH)
-    collection = client.get_or_create_collection(
-        name="fed_reports",
-        metadata={"hnsw:space": "cosine"},
-    )
+def build_file_chunks(full_path: str) -> Tuple[List[str], List[str], List[dict]]:
+    """Estrae e spezzetta un PDF, restituendo testi, id e metadati dei suoi chunk."""
+    fname = os.path.basename(full_path)
+    logger.info(f"Estrazione testo da {full_path}...")
+    pages_text, info = extract_pdf_pages(full_path)
+    full_text = "\n".join(pages_text)
+
+    # Offset iniziale di ogni pagina nel testo completo, per risalire alla pagina di un chunk
+    page_starts: List[int] = []
+    offset = 0
+    for page_text in pages_text:
+        page_starts.append(offset)
+        offset += len(page_text) + 1
+
+    report_year = detect_report_year(fname, info["title"])
+    chunks = chunk_spans(full_text)
+    logger.info(f"{fname}: creati {len(chunks)} chunk (anno report: {report_year}).")
+
+    docs: List[str] = []
+    ids: List[str] = []
+    metadatas: List[dict] = []
+    base_id = os.path.splitext(fname)[0]
+    for i, (start, chunk) in enumerate(chunks):
+        page = bisect_right(page_starts, start)
+        metadata = {
+            "source_file": fname,
+            "chunk_index": i,
+            "page": page,
+            "section": section_for_page(info["toc"], page),
+        }
+        # Chroma non accetta valori None nei metadati
+        if report_year is not None:
+            metadata["report_year"] = report_year
+        docs.append(chunk)
+        ids.append(f"{base_id}_chunk_{i}")
+        metadatas.append(metadata)
+    return docs, ids, metadatas
+
+
+def _version_timestamp(name: str) -> Optional[int]:
+    """Restituisce il timestamp di una versione della collection (0 per quella non versionata)."""
+    if name == COLLECTION_NAME:
+        return 0
+    prefix = f"{COLLECTION_NAME}_v"
+    if name.startswith(prefix) and name[len(prefix):].isdigit():
+        return int(name[len(prefix):])
+    return None
+
+
+def _copy_other_files(source, target, exclude_files: List[str], batch_size: int = 1000) -> int:
+    """Copia nella nuova versione i chunk degli altri file, riusando gli embedding già calcolati."""
+    copied = 0
+    offset = 0
+    while True:
+        batch = source.get(
+            where={"source_file": {"$nin": exclude_files}},
+            include=["documents", "metadatas", "embeddings"],
+            limit=batch_size,
+            offset=offset,
+        )
+        if not batch["ids"]:
+            break
+        target.add(
+            ids=batch["ids"],
+            documents=batch["documents"],
+            metadatas=batch["metadatas"],
+            embeddings=batch["embeddings"],
+        )
+        copied += len(batch["ids"])
+        offset += batch_size
+    return copied
+
+
+def ingest_documents(
+    pdf_paths: Optional[List[str]] = None,
+    keep_other_files: bool = False,
+    progress: Optional[Callable[[int, int], None]] = None,
+    write_batch_size: int = 256,
+    chunk_executor: Optional[Executor] = None,
+) -> Optional[str]:
+    """
+    Ingerisce i PDF (di default quelli in data/fed_reports) in una nuova versione della collection
+    Chroma e la rende attiva solo a scrittura completata, così le query non vedono mai un indice
+    parziale. Con `keep_other_files` i chunk degli altri file vengono copiati dalla versione attiva.
+    `progress(processati, totale)` viene chiamata dopo ogni batch scritto. Con `chunk_executor`
+    (es. un ProcessPoolExecutor) l'estrazione e il chunking dei PDF, che usano la CPU, girano fuori
+    dal processo chiamante.
+    Restituisce il nome della nuova versione.
+    """
+    logger.info("Inizio ingestion dei documenti FED...")
+
+    if pdf_paths is None:
+        if not os.path.isdir(DATA_DIR):
+            raise FileNotFoundError(f"Cartella dati non trovata: {DATA_DIR}")
+        pdf_paths = list_pdfs(DATA_DIR)
 
     all_docs: List[str] = []
     all_ids: List[str] = []
     all_metadatas: List[dict] = []
-
-    for fname in os.listdir(DATA_DIR):
-        if not fname.lower().endswith(".pdf"):
-            continue
-
-        full_path = os.path.join(DATA_DIR, fname)
-        logger.info(f"Estrazione testo da {full_path}...")
-        full_text = extract_pdf_text(full_path)
-
-        chunks = chunk_text(full_text)
-        logger.info(f"{fname}: creati {len(chunks)} chunk.")
-
-        base_id = os.path.splitext(fname)[0]
-        for i, chunk in enumerate(chunks):
-            doc_id = f"{base_id}_chunk_{i}"
-            all_docs.append(chunk)
-            all_ids.append(doc_id)
-            all_metadatas.append(
-                {
-                    "source_file": fname,
-                    "chunk_index": i,
-                }
-            )
+    if chunk_executor is not None:
+        file_chunks = list(chunk_executor.map(build_file_chunks, pdf_paths))
+    else:
+        file_chunks = [build_file_chunks(full_path) for full_path in pdf_paths]
+    for docs, ids, metadatas in file_chunks:
+        all_docs.extend(docs)
+        all_ids.extend(ids)
+        all_metadatas.extend(metadatas)
 
     if not all_docs:
         logger.warning("Nessun documento trovato da ingerire.")
-        return
+        return None
 
     logger.info(f"Totale chunk da ingerire: {len(all_docs)}")
 
-    embeddings = embed_chunks(all_docs)
+    # Prepara client Chroma e la nuova versione della collection
+    import chromadb
+
+    # Lettura della versione attiva, scrittura della nuova, swap e pulizia avvengono sotto lock:
+    # un'ingestion concorrente partirebbe dalla stessa versione e uno dei due risultati andrebbe perso
+    with _version_lock():
+        client = chromadb.PersistentClient(path=settings.chroma_path)
+        previous_name = active_collection_name(settings.chroma_path)
+        new_name = f"{COLLECTION_NAME}_v{time.time_ns() // 1000}"
+        collection = client.create_collection(
+            name=new_name,
+            metadata={"hnsw:space": "cosine"},
+        )
+
+        try:
+            if keep_other_files and previous_name in [c.name for c in client.list_collections()]:
+                copied = _copy_other_files(
+                    client.get_collection(previous_name),
+                    collection,
+                    exclude_files=[os.path.basename(path) for path in pdf_paths],
+                )
+                logger.info(f"Copiati {copied} chunk esistenti da {previous_name}.")
+
+            logger.info(f"Scrittura dei chunk e embedding in {new_name}...")
+            for i in range(0, len(all_docs), write_batch_size):
+                batch_end = i + write_batch_size
+                collection.add(
+                    documents=all_docs[i:batch_end],
+                    embeddings=embed_chunks(all_docs[i:batch_end]),
+                    ids=all_ids[i:batch_end],
+                    metadatas=all_metadatas[i:batch_end],
+                )
+                if progress is not None:
+                    progress(min(batch_end, len(all_docs)), len(all_docs))
+        except Exception:
+            # Una versione incompleta non deve restare nell'indice
+            client.delete_collection(new_name)
+            raise
+
+        # Swap atomico: da qui in poi le nuove query leggono la nuova versione
+        set_active_collection(settings.chroma_path, new_name)
+        logger.info(f"Versione attiva: {new_name} (precedente: {previous_name}).")
 
-    logger.info("Scrittura dei chunk e embedding in Chroma...")
-    collection.add(
-        documents=all_docs,
-        embeddings=embeddings,
-        ids=all_ids,
-        metadatas=all_metadatas,
-    )
+        # Mantiene la versione precedente per le query ancora in corso ed elimina quelle più vecchie
+        previous_ts = _version_timestamp(previous_name)
+        for existing in client.list_collections():
+            ts = _version_timestamp(existing.name)
+            if ts is not None and previous_ts is not None and ts < previous_ts:
+                logger.info(f"Eliminazione della versione obsoleta {existing.name}...")
+                client.delete_collection(existing.name)
 
     logger.info("Ingestion completata con successo!")
+    return new_name
+
+
+if __name__ == "__main__":
+    ingest_documents()
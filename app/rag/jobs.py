@@ -0,0 +1,169 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, BinaryIO, Dict, List, Optional
+
+from loguru import logger
+
+from app.observability.db import get_ingest_jobs, insert_ingest_job, update_ingest_job
+from app.rag.ingest import DATA_DIR, ingest_documents
+from app.rag.query import readiness
+
+# Dedicated worker pool for ingestion, separate from the threads serving queries. It has a
+# single worker: ingestion holds a lock around the active-version swap, so more workers
+# would only queue behind each other. The thread only waits on Ollama and writes to Chroma.
+_executor: Optional[ThreadPoolExecutor] = None
+# PDF parsing and chunking are CPU-bound: they run in a separate process, so they do not
+# compete for the GIL with the event loop serving /query
+_chunk_executor: Optional[ProcessPoolExecutor] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Creates the ingestion worker pool on first use."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest")
+    return _executor
+
+
+def _get_chunk_executor() -> ProcessPoolExecutor:
+    """Creates the PDF parsing process on first use."""
+    global _chunk_executor
+    if _chunk_executor is None:
+        # "spawn" avoids forking the threads of the API process
+        _chunk_executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+    return _chunk_executor
+
+
+def _publish(staged_path: str, data_dir: str):
+    """Moves an ingested upload into the data folder, replacing any previous file atomically."""
+    os.makedirs(data_dir, exist_ok=True)
+    target = os.path.join(data_dir, os.path.basename(staged_path))
+    tmp_target = os.path.join(data_dir, f".{os.path.basename(staged_path)}.tmp")
+    # The staging folder may be on another filesystem: copy next to the target, then rename
+    shutil.copyfile(staged_path, tmp_target)
+    os.replace(tmp_target, target)
+
+
+def _run_job(
+    job_id: str,
+    pdf_paths: Optional[List[str]],
+    keep_other_files: bool,
+    staging_dir: Optional[str] = None,
+):
+    """
+    Runs an ingestion job in a worker, recording its progress in the ingest_jobs table.
+    Files in `staging_dir` are moved into the data folder only once their version is active.
+    The staging folder is removed, unless that move fails: the version is live then, so the job
+    is still done, with the error recorded and the staged copy kept for a retry.
+    """
+    update_ingest_job(job_id, status="running", started_at=time.time())
+    logger.info(f"Ingestion job {job_id} started")
+
+    def progress(processed: int, total: int):
+        update_ingest_job(job_id, processed_chunks=processed, total_chunks=total)
+
+    publish_error: Optional[str] = None
+    try:
+        collection_name = ingest_documents(
+            pdf_paths=pdf_paths,
+            keep_other_files=keep_other_files,
+            progress=progress,
+            chunk_executor=_get_chunk_executor(),
+        )
+        if collection_name is not None:
+            # The new version is active: a pod deployed before its first index becomes ready
+            readiness["index"] = True
+            if staging_dir is not None:
+                try:
+                    for path in pdf_paths:
+                        _publish(path, DATA_DIR)
+                except Exception as e:
+                    publish_error = (
+                        f"Indexed into {collection_name}, but copying into {DATA_DIR} failed: {e}. "
+                        f"The upload is kept in {staging_dir}."
+                    )
+                    logger.error(f"Ingestion job {job_id}: {publish_error}")
+        update_ingest_job(
+            job_id,
+            status="done",
+            finished_at=time.time(),
+            collection_name=collection_name,
+            error=publish_error,
+        )
+        logger.info(f"Ingestion job {job_id} completed into {collection_name}")
+    except Exception as e:
+        logger.error(f"Ingestion job {job_id} failed: {e}")
+        update_ingest_job(job_id, status="failed", finished_at=time.time(), error=str(e))
+    finally:
+        if staging_dir is not None and publish_error is None:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+def submit_ingest_job(
+    source: str,
+    pdf_paths: Optional[List[str]] = None,
+    keep_other_files: bool = False,
+) -> str:
+    """
+    Queues an ingestion job and returns its id. `pdf_paths` defaults to every PDF in the data
+    folder; with `keep_other_files` the chunks of the other files are kept from the active version.
+    """
+    job_id = str(uuid.uuid4())
+    insert_ingest_job(job_id, source)
+    _get_executor().submit(_run_job, job_id, pdf_paths, keep_other_files)
+    return job_id
+
+
+def submit_upload_job(fname: str, fileobj: BinaryIO) -> str:
+    """
+    Stages an uploaded PDF in a folder owned by the job and queues its ingestion, keeping the
+    other reports from the active version. The data folder is untouched until the job succeeds.
+    """
+    staging_dir = tempfile.mkdtemp(prefix="ingest-upload-")
+    try:
+        staged_path = os.path.join(staging_dir, fname)
+        with open(staged_path, "wb") as out:
+            shutil.copyfileobj(fileobj, out)
+        job_id = str(uuid.uuid4())
+        insert_ingest_job(job_id, fname)
+        _get_executor().submit(_run_job, job_id, [staged_path], True, staging_dir)
+    except Exception:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+    return job_id
+
+
+def _with_throughput(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Adds the elapsed time and the throughput in chunks per second to a job row."""
+    elapsed_s = None
+    if job["started_at"] is not None:
+        elapsed_s = (job["finished_at"] or time.time()) - job["started_at"]
+    job["elapsed_s"] = round(elapsed_s, 1) if elapsed_s is not None else None
+    job["chunks_per_s"] = (
+        round(job["processed_chunks"] / elapsed_s, 2) if elapsed_s and job["processed_chunks"] else None
+    )
+    return job
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """Returns the status, progress and throughput of an ingestion job."""
+    jobs = get_ingest_jobs(job_id)
+    return _with_throughput(jobs[0]) if jobs else None
+
+
+def list_jobs(limit: int = 20) -> List[Dict[str, Any]]:
+    """Returns the most recent ingestion jobs."""
+    return [_with_throughput(job) for job in get_ingest_jobs(limit=limit)]
+
+
+def shutdown():
+    """Stops the worker pool, dropping the jobs that have not started yet."""
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+    if _chunk_executor is not None:
+        _chunk_executor.shutdown(wait=False, cancel_futures=True)
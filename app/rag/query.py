@@ -1,21 +1,45 @@
+import asyncio
 import time
 import uuid
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
-import chromadb
-import httpx
 from loguru import logger
 from opentelemetry import trace
 
 from app.observability.logger import RequestLogEntry, log_request
 from app.rag.tokenizer import count_tokens
+from app.rag.utils import active_collection_name, build_where_filter, extract_years
 from app.config import settings
 
 # Get a tracer for this module
 tracer = trace.get_tracer(__name__)
 
+# chromadb and httpx are imported on first use (or during warm-up) to keep the API cold
+# start fast. The warm-up state below is reported by the readiness endpoint.
+readiness = {"index": False, "model": False}
+
+# Static instructions sent as the Ollama system prompt. Keeping them identical and
+# ahead of the per-request context lets a resident model reuse the cached prefix
+# instead of re-processing it on every call.
+SYSTEM_PROMPT = """You are an assistant who answers based on excerpts from the Federal Reserve's (FED) annual performance reports.
+
+Instructions:
+- Answer clearly and concisely.
+- If possible, indicate which report/year you are referring to (even just by mentioning it in the text).
+- If the context does not contain enough information to answer reliably, state it explicitly."""
+
+
+def _ns_to_ms(value) -> Optional[int]:
+    """Converts an Ollama duration (nanoseconds) to milliseconds."""
+    if value is None:
+        return None
+    return round(value / 1_000_000)
+
+
 def embed_query(text: str) -> List[float]:
     """Calculates the embedding of a single query with Ollama."""
+    import httpx
+
     with httpx.Client() as client:
         resp = client.post(
             settings.ollama_embed_url,
@@ -30,81 +54,246 @@ def embed_query(text: str) -> List[float]:
         return embeddings[0]
 
 
-async def rag_query(question: str):
-    """Executes a RAG query on the FED reports, measuring performance and logging the details."""
+def warmup_index():
+    """Imports chromadb and opens the collection, so the first query does not pay for loading them."""
     t_start = time.perf_counter()
-    log_entry = RequestLogEntry(question=question)
-    
-    # Get the trace_id from the current span
-    current_span = trace.get_current_span()
-    if current_span.get_span_context().is_valid:
-        trace_id = current_span.get_span_context().trace_id
-        log_entry.trace_id = format(trace_id, '032x')
+    try:
+        import chromadb
+
+        client = chromadb.PersistentClient(path=settings.chroma_path)
+        name = active_collection_name(settings.chroma_path)
+        count = client.get_collection(name).count()
+        readiness["index"] = True
+        logger.info(f"Opened the {name} collection ({count} chunks) in {round((time.perf_counter() - t_start) * 1000)}ms")
+    except Exception as e:
+        logger.warning(f"Index warm-up failed for {settings.chroma_path}: {e}")
 
+
+async def warmup_model():
+    """Loads the generation model into Ollama and keeps it resident, so the first query does not pay for it."""
+    t_start = time.perf_counter()
     try:
-        logger.info(f"RAG query: {question!r} (request_id: {log_entry.request_id})")
+        import httpx
+
+        async with httpx.AsyncClient() as client_http:
+            resp = await client_http.post(
+                settings.ollama_gen_url,
+                json={
+                    "model": settings.gen_model,
+                    "system": SYSTEM_PROMPT,
+                    "prompt": "",
+                    "stream": False,
+                    "keep_alive": settings.ollama_keep_alive,
+                },
+                timeout=300,
+            )
+            resp.raise_for_status()
+            data = resp.json()
+        readiness["model"] = True
+        logger.info(
+            f"Warmed up {settings.gen_model} in {round((time.perf_counter() - t_start) * 1000)}ms "
+            f"(load: {_ns_to_ms(data.get('load_duration'))}ms)"
+        )
+    except Exception as e:
+        # The API must still start if Ollama is not reachable yet
+        logger.warning(f"Model warm-up failed for {settings.gen_model}: {e}")
+
+
+async def warmup_until_ready(initial_delay_s: float = 1.0, max_delay_s: float = 60.0):
+    """
+    Retries the index and model warm-ups with exponential backoff until both are ready, so a
+    process started before the collection exists or before Ollama is reachable becomes ready later.
+    """
+    delay_s = initial_delay_s
+    while True:
+        if not readiness["index"]:
+            await asyncio.to_thread(warmup_index)
+        if not readiness["model"]:
+            await warmup_model()
+        if all(readiness.values()):
+            return
+        logger.info(f"Warm-up incomplete ({readiness}), retrying in {delay_s:.0f}s")
+        await asyncio.sleep(delay_s)
+        delay_s = min(delay_s * 2, max_delay_s)
+
+
+# Pipeline executions in flight, keyed by normalized question and model settings, together
+# with the log entry of the request that started them (the "leader")
+_inflight: Dict[Tuple, Tuple["asyncio.Future[RequestLogEntry]", RequestLogEntry]] = {}
+
+# Fields of RequestLogEntry produced by the pipeline and shared by coalesced requests
+PIPELINE_FIELDS = ("answer", "retrieved_sources", "retrieved_distances")
 
-        # 1) Measure the retrieval latency (embedding + search)
-        with tracer.start_as_current_span("DB Vector Search") as span:
-            t_retrieval_start = time.perf_counter()
-            q_emb = embed_query(question)
-            client = chromadb.PersistentClient(path=settings.chroma_path)
-            collection = client.get_collection("fed_reports")
+# Cost of the pipeline run, logged only on the leader's row: coalesced rows leave them NULL
+# (their coalesced_with points at the leader) so aggregates count each run once
+PIPELINE_COST_FIELDS = (
+    "latency_ms_retrieval", "latency_ms_llm", "latency_ms_prefill", "latency_ms_load",
+    "prompt_tokens", "answer_tokens",
+)
+
+
+def _coalescing_key(
+    question: str,
+    report_years: Optional[List[int]],
+    source_files: Optional[List[str]],
+) -> Tuple:
+    """Builds the key under which identical concurrent requests share one pipeline execution."""
+    normalized = " ".join(question.lower().split())
+    return (
+        normalized,
+        settings.embed_model,
+        settings.gen_model,
+        tuple(sorted(report_years or [])),
+        tuple(sorted(source_files or [])),
+    )
+
+
+async def _run_pipeline(
+    question: str,
+    report_years: Optional[List[int]],
+    source_files: Optional[List[str]],
+) -> RequestLogEntry:
+    """Runs retrieval and generation once, returning an entry holding the pipeline fields."""
+    import chromadb
+    import httpx
+
+    result = RequestLogEntry(question=question)
+
+    # 1) Measure the retrieval latency (embedding + search)
+    with tracer.start_as_current_span("DB Vector Search") as span:
+        t_retrieval_start = time.perf_counter()
+        q_emb = embed_query(question)
+        client = chromadb.PersistentClient(path=settings.chroma_path)
+        # Read the active version: ingestion jobs swap it only once a new index is complete
+        collection = client.get_collection(active_collection_name(settings.chroma_path))
+        explicit_scope = bool(report_years or source_files)
+        where = build_where_filter(
+            report_years=report_years if explicit_scope else extract_years(question),
+            source_files=source_files,
+        )
+        results = collection.query(
+            query_embeddings=[q_emb],
+            n_results=4,
+            where=where,
+            include=["documents", "metadatas", "distances"],
+        )
+        if where is not None and not explicit_scope and not results["documents"][0]:
+            # The detected years are not in the index: search all reports instead
+            where = None
             results = collection.query(
                 query_embeddings=[q_emb],
                 n_results=4,
                 include=["documents", "metadatas", "distances"],
             )
-            t_retrieval_end = time.perf_counter()
-            log_entry.latency_ms_retrieval = round((t_retrieval_end - t_retrieval_start) * 1000)
-            span.set_attribute("latency_ms", log_entry.latency_ms_retrieval)
-
-        retrieved_docs = results["documents"][0]
-        log_entry.retrieved_sources = results["metadatas"][0]
-        log_entry.retrieved_distances = results["distances"][0]
-        
-        context_chunks = []
-        for doc, meta, dist in zip(retrieved_docs, log_entry.retrieved_sources, log_entry.retrieved_distances):
-            context_chunks.append(
-                f"From {meta.get('source_file')} (chunk {meta.get('chunk_index')}), distance={dist:.4f}:\n{doc}"
-            )
-        context = "\n\n---\n\n".join(context_chunks)
+        if where is not None:
+            span.set_attribute("where_filter", str(where))
+        t_retrieval_end = time.perf_counter()
+        result.latency_ms_retrieval = round((t_retrieval_end - t_retrieval_start) * 1000)
+        span.set_attribute("latency_ms", result.latency_ms_retrieval)
 
-        prompt = f"""
-You are an assistant who answers based on the following excerpts from the Federal Reserve's (FED) annual performance reports.
+    retrieved_docs = results["documents"][0]
+    result.retrieved_sources = results["metadatas"][0]
+    result.retrieved_distances = results["distances"][0]
+    
+    context_chunks = []
+    for doc, meta, dist in zip(retrieved_docs, result.retrieved_sources, result.retrieved_distances):
+        context_chunks.append(
+            f"From {meta.get('source_file')} (chunk {meta.get('chunk_index')}), distance={dist:.4f}:\n{doc}"
+        )
+    context = "\n\n---\n\n".join(context_chunks)
 
-Context:
+    prompt = f"""Context:
 {context}
 
 Question: {question}
 
-Instructions:
-- Answer clearly and concisely.
-- If possible, indicate which report/year you are referring to (even just by mentioning it in the text).
-- If the context does not contain enough information to answer reliably, state it explicitly.
 Answer:
 """
 
-        # 2) Measure the LLM call latency and estimate the tokens
-        with tracer.start_as_current_span("LLM Generation") as span:
-            log_entry.prompt_tokens = count_tokens(prompt)
-            t_llm_start = time.perf_counter()
-            async with httpx.AsyncClient() as client_http:
-                resp = await client_http.post(
-                    settings.ollama_gen_url,
-                    json={"model": settings.gen_model, "prompt": prompt, "stream": False},
-                    timeout=300,
-                )
-                resp.raise_for_status()
-                data = resp.json()
-                log_entry.answer = data.get("response", "").strip()
-            t_llm_end = time.perf_counter()
-            log_entry.latency_ms_llm = round((t_llm_end - t_llm_start) * 1000)
-            log_entry.answer_tokens = count_tokens(log_entry.answer)
-            span.set_attribute("latency_ms", log_entry.latency_ms_llm)
-            span.set_attribute("prompt_tokens", log_entry.prompt_tokens)
-            span.set_attribute("answer_tokens", log_entry.answer_tokens)
+    # 2) Measure the LLM call latency and estimate the tokens
+    with tracer.start_as_current_span("LLM Generation") as span:
+        result.prompt_tokens = count_tokens(SYSTEM_PROMPT) + count_tokens(prompt)
+        t_llm_start = time.perf_counter()
+        async with httpx.AsyncClient() as client_http:
+            resp = await client_http.post(
+                settings.ollama_gen_url,
+                json={
+                    "model": settings.gen_model,
+                    "system": SYSTEM_PROMPT,
+                    "prompt": prompt,
+                    "stream": False,
+                    "keep_alive": settings.ollama_keep_alive,
+                },
+                timeout=300,
+            )
+            resp.raise_for_status()
+            data = resp.json()
+            result.answer = data.get("response", "").strip()
+        t_llm_end = time.perf_counter()
+        result.latency_ms_llm = round((t_llm_end - t_llm_start) * 1000)
+        result.latency_ms_prefill = _ns_to_ms(data.get("prompt_eval_duration"))
+        result.latency_ms_load = _ns_to_ms(data.get("load_duration"))
+        result.answer_tokens = count_tokens(result.answer)
+        span.set_attribute("latency_ms", result.latency_ms_llm)
+        if result.latency_ms_prefill is not None:
+            span.set_attribute("latency_ms_prefill", result.latency_ms_prefill)
+        if result.latency_ms_load is not None:
+            span.set_attribute("latency_ms_load", result.latency_ms_load)
+        span.set_attribute("prompt_tokens", result.prompt_tokens)
+        span.set_attribute("answer_tokens", result.answer_tokens)
+
+    return result
+
+
+async def rag_query(
+    question: str,
+    report_years: Optional[List[int]] = None,
+    source_files: Optional[List[str]] = None,
+):
+    """
+    Executes a RAG query on the FED reports, measuring performance and logging the details.
+
+    The search is scoped to `report_years`/`source_files` when given; otherwise the years
+    mentioned in the question are used as a filter, falling back to the whole index if
+    no chunk matches them.
+    """
+    t_start = time.perf_counter()
+    log_entry = RequestLogEntry(question=question)
+    
+    # Get the trace_id from the current span
+    current_span = trace.get_current_span()
+    if current_span.get_span_context().is_valid:
+        trace_id = current_span.get_span_context().trace_id
+        log_entry.trace_id = format(trace_id, '032x')
+
+    try:
+        logger.info(f"RAG query: {question!r} (request_id: {log_entry.request_id})")
+
+        # Concurrent requests with the same question attach to a single pipeline execution
+        key = _coalescing_key(question, report_years, source_files)
+        inflight = _inflight.get(key)
+        if inflight is None:
+            # Run as a separate task so a cancelled request does not cancel the others' result
+            pipeline = asyncio.ensure_future(_run_pipeline(question, report_years, source_files))
+            _inflight[key] = (pipeline, log_entry)
+            pipeline.add_done_callback(
+                lambda task: _inflight.pop(key, None) if _inflight.get(key, (None,))[0] is task else None
+            )
+        else:
+            # The pipeline spans live in the leader's trace: record the leader so this row can be traced back
+            pipeline, leader = inflight
+            log_entry.coalesced = True
+            log_entry.coalesced_with = str(leader.request_id)
+            current_span.set_attribute("coalesced_with.request_id", log_entry.coalesced_with)
+            if leader.trace_id is not None:
+                current_span.set_attribute("coalesced_with.trace_id", leader.trace_id)
+            logger.info(f"Coalescing request {log_entry.request_id} with in-flight request {log_entry.coalesced_with}")
 
+        shared = await asyncio.shield(pipeline)
+        for field in PIPELINE_FIELDS:
+            setattr(log_entry, field, getattr(shared, field))
+        for field in PIPELINE_COST_FIELDS:
+            setattr(log_entry, field, None if log_entry.coalesced else getattr(shared, field))
 
         return {
             "request_id": str(log_entry.request_id),
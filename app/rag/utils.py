@@ -0,0 +1,59 @@
+import os
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Base name of the Chroma collection; ingestion writes versions named "<base>_v<timestamp>"
+COLLECTION_NAME = "fed_reports"
+# File, inside the Chroma directory, holding the name of the collection version in use
+ACTIVE_COLLECTION_FILE = "active_collection"
+
+# Four-digit years plausible for a FED report (e.g. "2020", "FY 2022", "FY2022")
+YEAR_PATTERN = re.compile(r"(?<!\d)((?:19|20)\d{2})(?!\d)")
+
+
+def extract_years(text: str) -> List[int]:
+    """Returns the distinct years mentioned in a text, in order of appearance."""
+    years: List[int] = []
+    for match in YEAR_PATTERN.findall(text or ""):
+        year = int(match)
+        if year not in years:
+            years.append(year)
+    return years
+
+
+def build_where_filter(
+    report_years: Optional[List[int]] = None,
+    source_files: Optional[List[str]] = None,
+) -> Optional[Dict[str, Any]]:
+    """Builds a Chroma `where` filter scoping a search to the given report years and source files."""
+    conditions: List[Dict[str, Any]] = []
+    if report_years:
+        conditions.append({"report_year": {"$in": list(report_years)}})
+    if source_files:
+        conditions.append({"source_file": {"$in": list(source_files)}})
+
+    if not conditions:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"$and": conditions}
+
+
+def active_collection_name(chroma_path: str) -> str:
+    """Returns the collection version queries should read, defaulting to the unversioned collection."""
+    pointer = Path(chroma_path) / ACTIVE_COLLECTION_FILE
+    try:
+        return pointer.read_text().strip() or COLLECTION_NAME
+    except FileNotFoundError:
+        return COLLECTION_NAME
+
+
+def set_active_collection(chroma_path: str, name: str):
+    """Atomically points queries to another collection version."""
+    pointer = Path(chroma_path) / ACTIVE_COLLECTION_FILE
+    pointer.parent.mkdir(parents=True, exist_ok=True)
+    tmp_pointer = pointer.with_suffix(".tmp")
+    tmp_pointer.write_text(name)
+    # os.replace is atomic, so a reader sees either the old or the new name
+    os.replace(tmp_pointer, pointer)
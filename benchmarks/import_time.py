@@ -0,0 +1,77 @@
+"""
+Import-time benchmark for the API and the ingest CLI.
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter and reports the
+total import cost and the most expensive dependencies, so that regressions in cold start
+time are easy to spot.
+
+Usage:
+    python benchmarks/import_time.py app.main app.rag.ingest
+    python benchmarks/import_time.py app.main --json
+"""
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Backends that must not be loaded just by importing the API or the ingest CLI
+HEAVY_MODULES = ["chromadb", "fitz", "pyarrow", "httpx", "opentelemetry.sdk"]
+
+
+def measure_import_time(module: str) -> Dict[str, int]:
+    """Returns the cumulative import time (microseconds) of every module loaded by `import module`."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    cumulative: Dict[str, int] = {}
+    for line in proc.stderr.splitlines():
+        # Format: "import time: <self us> | <cumulative us> | <indented module name>"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        cumulative[name.strip()] = int(cumulative_us)
+    return cumulative
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the import time of the project entry points.")
+    parser.add_argument("modules", nargs="*", default=["app.main", "app.rag.ingest"])
+    parser.add_argument("--top", type=int, default=10, help="Number of dependencies to show")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    results = {}
+    for module in args.modules:
+        cumulative = measure_import_time(module)
+        dependencies = sorted(
+            ((name, us) for name, us in cumulative.items() if name != module),
+            key=lambda item: item[1],
+            reverse=True,
+        )
+        results[module] = {
+            "total_ms": round(cumulative.get(module, 0) / 1000, 1),
+            "heavy_modules_loaded": [m for m in HEAVY_MODULES if m in cumulative],
+            "top_ms": {name: round(us / 1000, 1) for name, us in dependencies[:args.top]},
+        }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for module, result in results.items():
+        print(f"{module}: {result['total_ms']} ms")
+        print(f"  heavy modules loaded: {', '.join(result['heavy_modules_loaded']) or 'none'}")
+        for name, ms in result["top_ms"].items():
+            print(f"  {ms:>8} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
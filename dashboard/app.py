@@ -3,12 +3,23 @@ import pandas as pd
 import sqlite3
 from pathlib import Path
 import json
+from datetime import date, timedelta
+import pyarrow.dataset as ds
 from config import settings
 
 # Set the page layout to 'wide' to use more space
 st.set_page_config(layout="wide")
 
 DB_PATH = Path(settings.db_path).resolve()
+ARCHIVE_PATH = Path(settings.archive_path).resolve() / "requests_log"
+
+# Columns read from the Parquet archive; the others (e.g. retrieved_sources) are never loaded
+ARCHIVE_COLUMNS = [
+    'timestamp', 'request_id', 'trace_id', 'question', 'answer',
+    'latency_ms_total', 'latency_ms_retrieval', 'latency_ms_llm',
+    'latency_ms_prefill', 'latency_ms_load', 'retrieved_distances',
+    'prompt_tokens', 'answer_tokens', 'error', 'coalesced', 'coalesced_with', 'rating', 'comment'
+]
 
 st.title("RAG Observability Dashboard")
 
@@ -36,7 +47,7 @@ def load_data():
         # Convert numeric columns
         numeric_cols = [
             'latency_ms_total', 'latency_ms_retrieval', 'latency_ms_llm',
-            'prompt_tokens', 'answer_tokens', 'rating'
+            'latency_ms_prefill', 'latency_ms_load', 'prompt_tokens', 'answer_tokens', 'rating'
         ]
         for col in numeric_cols:
             if col in df.columns:
@@ -47,8 +58,37 @@ def load_data():
         st.error(f"Error loading data: {e}")
         return pd.DataFrame()
 
+@st.cache_data(ttl=60)
+def load_archive(start: date, end: date):
+    """Lazily loads the Parquet archive, reading only the needed columns and day partitions."""
+    if not ARCHIVE_PATH.exists():
+        st.warning(f"Archive not found at path: {ARCHIVE_PATH}")
+        return pd.DataFrame()
+    try:
+        dataset = ds.dataset(ARCHIVE_PATH, format="parquet", partitioning="hive")
+        # The filter on the 'date' partition prunes whole files before anything is read
+        day_filter = (ds.field('date') >= start.isoformat()) & (ds.field('date') <= end.isoformat())
+        table = dataset.to_table(columns=ARCHIVE_COLUMNS, filter=day_filter)
+        return table.to_pandas().sort_values('timestamp', ascending=False)
+    except Exception as e:
+        st.error(f"Error loading archive: {e}")
+        return pd.DataFrame()
+
 # Load the data
-data = load_data()
+source = st.sidebar.radio("Data source", ["Live database", "Parquet archive"])
+if source == "Parquet archive":
+    date_range = st.sidebar.date_input(
+        "Date range", value=(date.today() - timedelta(days=30), date.today())
+    )
+    if not date_range:
+        # The range picker was cleared
+        st.info("Select a date range to load the archive.")
+        st.stop()
+    # While the user is picking the range only the start day is set
+    start_day, end_day = date_range if len(date_range) == 2 else (date_range[0], date_range[0])
+    data = load_archive(start_day, end_day)
+else:
+    data = load_data()
 
 if data.empty:
     st.warning("No data found in the database. Run some queries on the API.")
@@ -94,8 +134,8 @@ else:
     st.header("Latest Requests Details")
     
     display_cols = [
-        'timestamp', 'trace_id', 'rating', 'question', 'answer', 'latency_ms_total', 
-        'retrieved_distances', 'error', 'comment'
+        'timestamp', 'trace_id', 'rating', 'question', 'answer', 'latency_ms_total',
+        'latency_ms_prefill', 'latency_ms_load', 'retrieved_distances', 'coalesced', 'coalesced_with', 'error', 'comment'
     ]
     display_cols = [col for col in display_cols if col in data.columns]
     
@@ -104,8 +144,10 @@ else:
     # Formatting for better visualization
     display_df['answer'] = display_df['answer'].str.slice(0, 150) + '...'
     if 'retrieved_distances' in display_df:
+        # JSON text in the live database, a native list in the archive
         display_df['retrieved_distances'] = display_df['retrieved_distances'].apply(
-            lambda x: [round(d, 2) for d in json.loads(x)] if x and x != 'null' else []
+            lambda x: [round(d, 2) for d in (json.loads(x) if isinstance(x, str) else x)]
+            if x is not None and not (isinstance(x, str) and x in ('', 'null')) else []
         )
 
     st.dataframe(display_df, use_container_width=True)
@@ -3,6 +3,7 @@ from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     db_path: str = "observability.db"
+    archive_path: str = "observability_archive"
 
 
 settings = Settings()
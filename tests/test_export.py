@@ -0,0 +1,118 @@
+import sqlite3
+from datetime import date
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pytest
+
+from app.observability import db, export
+
+
+@pytest.fixture
+def populated_db(tmp_path, monkeypatch):
+    """
+    Creates a temporary observability database with requests spread over two days.
+    """
+    db_path = tmp_path / "observability.db"
+    monkeypatch.setattr(db, "DB_PATH", db_path)
+    monkeypatch.setattr(export, "DB_PATH", db_path)
+    db.init_db()
+
+    for i, timestamp in enumerate(["2026-01-01 10:00:00", "2026-01-01 23:59:59", "2026-01-02 08:30:00"]):
+        db.insert_log(
+            request_id=f"req-{i}",
+            question=f"Question {i}",
+            answer=f"Answer {i}",
+            latency_ms_total=100 + i,
+            latency_ms_retrieval=10,
+            latency_ms_llm=90,
+            latency_ms_prefill=20,
+            latency_ms_load=None,
+            retrieved_sources=[{"source_file": "test.pdf", "chunk_index": i}],
+            retrieved_distances=[0.25, 0.5] if i else None,
+            prompt_tokens=50,
+            answer_tokens=5,
+            error=None,
+            trace_id=None,
+        )
+        conn = sqlite3.connect(db_path)
+        conn.execute("UPDATE requests_log SET timestamp = ? WHERE request_id = ?", (timestamp, f"req-{i}"))
+        conn.commit()
+        conn.close()
+    db.insert_feedback(request_id="req-1", rating=4, comment="Good")
+    return db_path
+
+
+def test_export_requests_partitions_by_day(populated_db, tmp_path):
+    """
+    Tests that the export streams rows into one Parquet partition per day with numeric columns.
+    """
+    archive = tmp_path / "archive"
+
+    summary = export.export_requests(archive, batch_size=2)
+
+    assert summary["rows"] == 3
+    assert summary["partitions"] == ["2026-01-01", "2026-01-02"]
+    assert (archive / "requests_log" / "date=2026-01-01" / "part-0.parquet").exists()
+    assert not list(archive.rglob("*.tmp"))
+
+    dataset = ds.dataset(archive / "requests_log", format="parquet", partitioning="hive")
+    assert dataset.schema.field("retrieved_distances").type == pa.list_(pa.float32())
+    assert dataset.schema.field("prompt_tokens").type == pa.int32()
+
+    table = dataset.to_table(
+        columns=["request_id", "retrieved_distances", "rating"],
+        filter=ds.field("date") == "2026-01-01",
+    ).sort_by("request_id")
+    assert table.column("request_id").to_pylist() == ["req-0", "req-1"]
+    assert table.column("retrieved_distances").to_pylist() == [None, [0.25, 0.5]]
+    assert table.column("rating").to_pylist() == [None, 4]
+
+
+def test_export_requests_respects_date_range(populated_db, tmp_path):
+    """
+    Tests that only the requested days are exported.
+    """
+    summary = export.export_requests(tmp_path / "archive", since=date(2026, 1, 2))
+
+    assert summary["rows"] == 1
+    assert summary["partitions"] == ["2026-01-02"]
+
+
+def test_export_requests_cleans_up_on_failure(populated_db, tmp_path, mocker):
+    """
+    Tests that a failing export closes its writer and leaves no temporary files behind.
+    """
+    archive = tmp_path / "archive"
+    real_rows_to_batch = export._rows_to_batch
+    calls = []
+
+    def failing_rows_to_batch(rows):
+        calls.append(rows)
+        if len(calls) > 1:
+            raise ValueError("bad row")
+        return real_rows_to_batch(rows)
+
+    mocker.patch.object(export, "_rows_to_batch", side_effect=failing_rows_to_batch)
+
+    with pytest.raises(ValueError):
+        export.export_requests(archive, batch_size=1)
+
+    assert not list(archive.rglob("*.tmp"))
+
+
+def test_overlapping_exports_publish_complete_partitions(populated_db, tmp_path):
+    """
+    Tests that concurrent exports of the same days each write their own temp file, so the
+    published partitions are always complete.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    archive = tmp_path / "archive"
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        summaries = list(pool.map(lambda _: export.export_requests(archive, batch_size=1), range(4)))
+
+    assert all(summary["rows"] == 3 for summary in summaries)
+    assert not list(archive.rglob("*.tmp"))
+    dataset = ds.dataset(archive / "requests_log", format="parquet", partitioning="hive")
+    assert dataset.count_rows() == 3
@@ -0,0 +1,25 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def test_entry_points_do_not_import_heavy_backends():
+    """
+    Tests, through the import-time benchmark, that importing the API or the ingest CLI
+    does not load chromadb, PyMuPDF, pyarrow, httpx or the OpenTelemetry SDK.
+    """
+    proc = subprocess.run(
+        [sys.executable, "benchmarks/import_time.py", "app.main", "app.rag.ingest", "--json"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    results = json.loads(proc.stdout)
+
+    for module in ("app.main", "app.rag.ingest"):
+        assert results[module]["total_ms"] > 0
+        assert results[module]["heavy_modules_loaded"] == []
@@ -0,0 +1,299 @@
+import io
+import os
+import shutil
+
+import chromadb
+import pytest
+
+from app.config import settings
+from app.observability import db
+from app.rag import ingest, jobs
+from app.rag.utils import active_collection_name
+
+
+def _fake_file_chunks(full_path):
+    """Returns two chunks per file without parsing any PDF."""
+    fname = full_path.split("/")[-1]
+    docs = [f"{fname} chunk {i}" for i in range(2)]
+    ids = [f"{fname}_chunk_{i}" for i in range(2)]
+    metadatas = [{"source_file": fname, "chunk_index": i} for i in range(2)]
+    return docs, ids, metadatas
+
+
+@pytest.fixture
+def chroma_path(tmp_path, mocker):
+    """
+    Points ingestion to a temporary Chroma directory and mocks PDF parsing and embeddings.
+    """
+    path = str(tmp_path / "chroma_db")
+    mocker.patch.object(settings, "chroma_path", path)
+    mocker.patch.object(ingest, "build_file_chunks", side_effect=_fake_file_chunks)
+    mocker.patch.object(ingest, "embed_chunks", side_effect=lambda chunks: [[1.0, 0.0]] * len(chunks))
+    mocker.patch("app.rag.ingest.logger")
+    return path
+
+
+def test_ingest_documents_swaps_in_a_new_version(chroma_path):
+    """
+    Tests that each ingestion writes a new collection version, makes it active and prunes
+    the versions older than the previous one.
+    """
+    progress = []
+    first = ingest.ingest_documents(pdf_paths=["a.pdf", "b.pdf"], progress=lambda done, total: progress.append((done, total)))
+    assert active_collection_name(chroma_path) == first
+    assert progress == [(4, 4)]
+
+    # Re-ingesting one file keeps the chunks of the other file from the active version
+    second = ingest.ingest_documents(pdf_paths=["b.pdf"], keep_other_files=True)
+    client = chromadb.PersistentClient(path=chroma_path)
+    collection = client.get_collection(second)
+    assert active_collection_name(chroma_path) == second
+    assert sorted(collection.get()["ids"]) == ["a.pdf_chunk_0", "a.pdf_chunk_1", "b.pdf_chunk_0", "b.pdf_chunk_1"]
+
+    third = ingest.ingest_documents(pdf_paths=["a.pdf"])
+    names = {c.name for c in client.list_collections()}
+    assert names == {second, third}
+
+
+def test_ingest_documents_keeps_active_version_on_failure(chroma_path, mocker):
+    """
+    Tests that a failed ingestion drops its partial version and leaves the active one untouched.
+    """
+    first = ingest.ingest_documents(pdf_paths=["a.pdf"])
+    mocker.patch.object(ingest, "embed_chunks", side_effect=RuntimeError("Ollama is down"))
+
+    with pytest.raises(RuntimeError):
+        ingest.ingest_documents(pdf_paths=["b.pdf"])
+
+    client = chromadb.PersistentClient(path=chroma_path)
+    assert active_collection_name(chroma_path) == first
+    assert [c.name for c in client.list_collections()] == [first]
+
+
+def test_ingest_job_records_progress(tmp_path, monkeypatch, mocker):
+    """
+    Tests that a submitted job runs in the worker pool and reports its progress and throughput.
+    """
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "observability.db")
+    db.init_db()
+    mocker.patch("app.rag.jobs.logger")
+
+    def fake_ingest(pdf_paths, keep_other_files, progress, chunk_executor):
+        progress(10, 20)
+        progress(20, 20)
+        return "fed_reports_v1"
+
+    mocker.patch("app.rag.jobs.ingest_documents", side_effect=fake_ingest)
+    mocker.patch.object(jobs, "_executor", None)
+    mocker.patch.dict(jobs.readiness, {"index": False, "model": True})
+
+    job_id = jobs.submit_ingest_job(source="test")
+    jobs._executor.shutdown(wait=True)
+
+    job = jobs.get_job(job_id)
+    assert job["status"] == "done"
+    assert job["processed_chunks"] == job["total_chunks"] == 20
+    assert job["collection_name"] == "fed_reports_v1"
+    assert job["elapsed_s"] is not None
+    assert jobs.readiness["index"] is True
+    assert [j["job_id"] for j in jobs.list_jobs()] == [job_id]
+
+
+def test_ingest_folder_endpoint_rejects_folders_outside_data_dir(mocker):
+    """
+    Tests that folder jobs can only index subfolders of the FED reports folder.
+    """
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    mock_submit = mocker.patch("app.rag.jobs.submit_ingest_job", return_value="job-1")
+    client = TestClient(app)
+
+    for folder in ("/etc", "../..", "../../app"):
+        response = client.post("/ingest/jobs", json={"folder": folder})
+        assert response.status_code == 400
+    mock_submit.assert_not_called()
+
+    # The data folder itself is a full rebuild
+    response = client.post("/ingest/jobs", json={"folder": "."})
+    assert response.status_code == 202
+    assert mock_submit.call_args.kwargs["pdf_paths"] is None
+    assert mock_submit.call_args.kwargs["keep_other_files"] is False
+
+
+def test_ingest_folder_endpoint_subfolder_keeps_other_reports(tmp_path, mocker):
+    """
+    Tests that a subfolder job indexes only that subfolder's PDFs and keeps the other reports.
+    """
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    (tmp_path / "2023").mkdir()
+    (tmp_path / "2023" / "2023-report.pdf").write_bytes(b"%PDF")
+    (tmp_path / "2022-report.pdf").write_bytes(b"%PDF")
+    mocker.patch("app.main.DATA_DIR", str(tmp_path))
+    mock_submit = mocker.patch("app.rag.jobs.submit_ingest_job", return_value="job-1")
+
+    response = TestClient(app).post("/ingest/jobs", json={"folder": "2023"})
+
+    assert response.status_code == 202
+    assert mock_submit.call_args.kwargs["pdf_paths"] == [str(tmp_path / "2023" / "2023-report.pdf")]
+    assert mock_submit.call_args.kwargs["keep_other_files"] is True
+
+
+def test_subfolder_reports_survive_a_full_rebuild(chroma_path, tmp_path, mocker):
+    """
+    Tests that a full rebuild also indexes the PDFs in subfolders of the data folder, and that
+    a subfolder re-index keeps the other reports in the new version.
+    """
+    data_dir = tmp_path / "fed_reports"
+    (data_dir / "2023").mkdir(parents=True)
+    for path in (data_dir / "2022.pdf", data_dir / "2023" / "2023.pdf"):
+        path.write_bytes(b"%PDF")
+    mocker.patch.object(ingest, "DATA_DIR", str(data_dir))
+
+    full = ingest.ingest_documents()
+    subfolder = ingest.ingest_documents(pdf_paths=ingest.list_pdfs(str(data_dir / "2023")), keep_other_files=True)
+
+    client = chromadb.PersistentClient(path=chroma_path)
+    for name in (full, subfolder):
+        ids = sorted(client.get_collection(name).get()["ids"])
+        assert ids == ["2022.pdf_chunk_0", "2022.pdf_chunk_1", "2023.pdf_chunk_0", "2023.pdf_chunk_1"]
+
+
+def test_concurrent_ingestions_do_not_lose_updates(chroma_path):
+    """
+    Tests that two concurrent incremental ingestions are serialized, so the final version
+    contains the chunks of both files.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        futures = [
+            pool.submit(ingest.ingest_documents, pdf_paths=[fname], keep_other_files=True)
+            for fname in ("a.pdf", "b.pdf")
+        ]
+        names = [future.result() for future in futures]
+
+    active = active_collection_name(chroma_path)
+    assert active in names
+    collection = chromadb.PersistentClient(path=chroma_path).get_collection(active)
+    assert sorted(collection.get()["ids"]) == ["a.pdf_chunk_0", "a.pdf_chunk_1", "b.pdf_chunk_0", "b.pdf_chunk_1"]
+
+
+@pytest.mark.parametrize("succeeds", [True, False])
+def test_upload_job_publishes_the_file_only_on_success(tmp_path, monkeypatch, mocker, succeeds):
+    """
+    Tests that an uploaded PDF is staged outside the data folder, moved into it only once its
+    version is active, and that the staging folder is always removed.
+    """
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "observability.db")
+    db.init_db()
+    data_dir = tmp_path / "fed_reports"
+    mocker.patch.object(jobs, "DATA_DIR", str(data_dir))
+    mocker.patch.object(jobs, "_executor", None)
+    mocker.patch.dict(jobs.readiness, {"index": False, "model": False})
+    mocker.patch("app.rag.jobs.logger")
+    staged = []
+
+    def fake_ingest(pdf_paths, keep_other_files, progress, chunk_executor):
+        staged.extend(pdf_paths)
+        assert keep_other_files
+        assert not (data_dir / "new.pdf").exists()
+        if not succeeds:
+            raise RuntimeError("Ollama is down")
+        return "fed_reports_v1"
+
+    mocker.patch("app.rag.jobs.ingest_documents", side_effect=fake_ingest)
+
+    job_id = jobs.submit_upload_job("new.pdf", io.BytesIO(b"%PDF-1.7 test"))
+    jobs._executor.shutdown(wait=True)
+
+    assert jobs.get_job(job_id)["status"] == ("done" if succeeds else "failed")
+    assert (data_dir / "new.pdf").exists() is succeeds
+    if succeeds:
+        assert (data_dir / "new.pdf").read_bytes() == b"%PDF-1.7 test"
+    assert not list(tmp_path.rglob("*.tmp"))
+    assert not os.path.exists(os.path.dirname(staged[0]))
+
+
+@pytest.mark.skipif(ingest.fcntl is None, reason="file locks need fcntl")
+def test_ingestion_waits_for_another_process_holding_the_lock(chroma_path):
+    """
+    Tests that an ingestion waits while another process (e.g. the CLI) holds the version lock.
+    """
+    import subprocess
+    import sys
+    import time
+
+    os.makedirs(chroma_path, exist_ok=True)
+    lock_path = os.path.join(chroma_path, ingest.VERSION_LOCK_FILE)
+    holder = subprocess.Popen(
+        [
+            sys.executable, "-c",
+            "import fcntl, sys, time\n"
+            f"f = open({lock_path!r}, 'w'); fcntl.flock(f, fcntl.LOCK_EX)\n"
+            "print('locked', flush=True); time.sleep(1)",
+        ],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    assert holder.stdout.readline().strip() == "locked"
+
+    t_start = time.perf_counter()
+    ingest.ingest_documents(pdf_paths=["a.pdf"])
+    waited_s = time.perf_counter() - t_start
+    holder.wait()
+
+    assert waited_s > 0.5
+
+
+def test_ingest_documents_parses_pdfs_in_another_process(tmp_path, mocker):
+    """
+    Tests that PDF parsing and chunking can run in a process pool, off the caller's GIL.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    chroma_path = str(tmp_path / "chroma_db")
+    mocker.patch.object(settings, "chroma_path", chroma_path)
+    mocker.patch.object(ingest, "embed_chunks", side_effect=lambda chunks: [[1.0, 0.0]] * len(chunks))
+    mocker.patch("app.rag.ingest.logger")
+    pdf_path = os.path.join(os.path.dirname(__file__), "..", "app", "data", "fed_reports", "2020-annual-performance-report.pdf")
+
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        name = ingest.ingest_documents(pdf_paths=[pdf_path], chunk_executor=pool)
+
+    metadatas = chromadb.PersistentClient(path=chroma_path).get_collection(name).get()["metadatas"]
+    assert metadatas
+    assert {meta["report_year"] for meta in metadatas} == {2020}
+
+
+def test_upload_job_keeps_staged_file_when_publishing_fails(tmp_path, monkeypatch, mocker):
+    """
+    Tests that a failure to copy an indexed upload into the data folder leaves the job done,
+    records the error and keeps the staged file for a retry.
+    """
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "observability.db")
+    db.init_db()
+    mocker.patch.object(jobs, "_executor", None)
+    mocker.patch.dict(jobs.readiness, {"index": False, "model": False})
+    mocker.patch("app.rag.jobs.logger")
+    staged = []
+
+    def fake_ingest(pdf_paths, keep_other_files, progress, chunk_executor):
+        staged.extend(pdf_paths)
+        return "fed_reports_v1"
+
+    mocker.patch("app.rag.jobs.ingest_documents", side_effect=fake_ingest)
+    mocker.patch("app.rag.jobs._publish", side_effect=OSError("disk full"))
+
+    job_id = jobs.submit_upload_job("new.pdf", io.BytesIO(b"%PDF-1.7 test"))
+    jobs._executor.shutdown(wait=True)
+
+    job = jobs.get_job(job_id)
+    assert job["status"] == "done"
+    assert job["collection_name"] == "fed_reports_v1"
+    assert "disk full" in job["error"]
+    assert os.path.exists(staged[0])
+    shutil.rmtree(os.path.dirname(staged[0]))
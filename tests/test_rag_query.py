@@ -1,6 +1,8 @@
+import asyncio
+import httpx
 import pytest
 from unittest.mock import MagicMock, AsyncMock
-from app.rag.query import rag_query
+from app.rag.query import rag_query, readiness, warmup_index, warmup_model, warmup_until_ready, SYSTEM_PROMPT
 
 @pytest.mark.asyncio
 async def test_rag_query_success(mocker):
@@ -22,7 +24,11 @@ async def test_rag_query_success(mocker):
     
     mock_http_response = MagicMock()
     mock_http_response.raise_for_status = MagicMock()
-    mock_http_response.json.return_value = {"response": "This is a test answer."}
+    mock_http_response.json.return_value = {
+        "response": "This is a test answer.",
+        "prompt_eval_duration": 250_000_000,
+        "load_duration": 5_000_000,
+    }
     
     mock_async_client = AsyncMock()
     mock_async_client.__aenter__.return_value.post = AsyncMock(return_value=mock_http_response)
@@ -50,3 +56,205 @@ async def test_rag_query_success(mocker):
     mock_collection.query.assert_called_once()
     mock_async_client.__aenter__.return_value.post.assert_called_once()
     mock_log_request.assert_called_once()
+
+
+    # 5. The static instructions travel as a reusable system prompt, and Ollama timings are logged
+    payload = mock_async_client.__aenter__.return_value.post.call_args.kwargs["json"]
+    assert payload["system"] == SYSTEM_PROMPT
+    assert "keep_alive" in payload
+    assert question in payload["prompt"]
+    assert SYSTEM_PROMPT not in payload["prompt"]
+    log_entry = mock_log_request.call_args.args[0]
+    assert log_entry.latency_ms_prefill == 250
+    assert log_entry.latency_ms_load == 5
+
+
+@pytest.mark.asyncio
+async def test_warmup_model_does_not_raise_when_ollama_is_down(mocker):
+    """
+    Tests that the startup warm-up swallows connection errors so the API can still start.
+    """
+    mock_async_client = AsyncMock()
+    mock_async_client.__aenter__.return_value.post = AsyncMock(side_effect=httpx.ConnectError("refused"))
+    mocker.patch("httpx.AsyncClient", return_value=mock_async_client)
+    mock_logger = mocker.patch("app.rag.query.logger")
+
+    await warmup_model()
+
+    mock_async_client.__aenter__.return_value.post.assert_called_once()
+    mock_logger.warning.assert_called_once()
+
+
+def _mock_pipeline(mocker, query_results):
+    """Mocks embedding, Chroma and Ollama, returning the mocked collection."""
+    mocker.patch("app.rag.query.embed_query", return_value=[0.1] * 1536)
+    mock_collection = MagicMock()
+    mock_collection.query.side_effect = query_results
+    mock_chroma_client = MagicMock()
+    mock_chroma_client.get_collection.return_value = mock_collection
+    mocker.patch("chromadb.PersistentClient", return_value=mock_chroma_client)
+
+    mock_http_response = MagicMock()
+    mock_http_response.json.return_value = {"response": "This is a test answer."}
+    mock_async_client = AsyncMock()
+    mock_async_client.__aenter__.return_value.post = AsyncMock(return_value=mock_http_response)
+    mocker.patch("httpx.AsyncClient", return_value=mock_async_client)
+
+    mocker.patch("app.rag.query.log_request")
+    mocker.patch("app.rag.query.logger")
+    return mock_collection
+
+
+_ONE_RESULT = {
+    "documents": [["This is a test document."]],
+    "metadatas": [[{"source_file": "2020-annual-performance-report.pdf", "chunk_index": 1, "report_year": 2020}]],
+    "distances": [[0.123]],
+}
+_NO_RESULTS = {"documents": [[]], "metadatas": [[]], "distances": [[]]}
+
+
+@pytest.mark.asyncio
+async def test_rag_query_filters_by_year_in_question(mocker):
+    """
+    Tests that a year mentioned in the question is pushed down as a Chroma `where` filter.
+    """
+    mock_collection = _mock_pipeline(mocker, [_ONE_RESULT])
+
+    await rag_query("What were the hiring goals in 2020?")
+
+    mock_collection.query.assert_called_once()
+    assert mock_collection.query.call_args.kwargs["where"] == {"report_year": {"$in": [2020]}}
+
+
+@pytest.mark.asyncio
+async def test_rag_query_falls_back_when_detected_year_matches_nothing(mocker):
+    """
+    Tests that a detected year without matching chunks falls back to an unfiltered search.
+    """
+    mock_collection = _mock_pipeline(mocker, [_NO_RESULTS, _ONE_RESULT])
+
+    result = await rag_query("What happened in 1999?")
+
+    assert mock_collection.query.call_count == 2
+    assert "where" not in mock_collection.query.call_args_list[1].kwargs
+    assert len(result["retrieved"]) == 1
+
+
+@pytest.mark.asyncio
+async def test_rag_query_explicit_scope_overrides_detection(mocker):
+    """
+    Tests that an explicit scope replaces the detected years and is never relaxed.
+    """
+    mock_collection = _mock_pipeline(mocker, [_NO_RESULTS])
+
+    result = await rag_query(
+        "What happened in 2020?",
+        report_years=[2022],
+        source_files=["2022-annual-performance-report.pdf"],
+    )
+
+    mock_collection.query.assert_called_once()
+    assert mock_collection.query.call_args.kwargs["where"] == {
+        "$and": [
+            {"report_year": {"$in": [2022]}},
+            {"source_file": {"$in": ["2022-annual-performance-report.pdf"]}},
+        ]
+    }
+    assert result["retrieved"] == []
+
+
+@pytest.mark.asyncio
+async def test_rag_query_coalesces_identical_concurrent_questions(mocker):
+    """
+    Tests that concurrent identical questions share one pipeline run but are logged separately.
+    """
+    mock_collection = _mock_pipeline(mocker, [_ONE_RESULT])
+    mock_log_request = mocker.patch("app.rag.query.log_request")
+
+    # Delay the LLM call so the second request arrives while the first is in flight
+    mock_http_response = MagicMock()
+    mock_http_response.json.return_value = {"response": "This is a test answer."}
+
+    async def slow_post(*args, **kwargs):
+        await asyncio.sleep(0.05)
+        return mock_http_response
+
+    mock_async_client = AsyncMock()
+    mock_async_client.__aenter__.return_value.post = AsyncMock(side_effect=slow_post)
+    mocker.patch("httpx.AsyncClient", return_value=mock_async_client)
+
+    first, second = await asyncio.gather(
+        rag_query("What is a test?"),
+        rag_query("  what is a   TEST? "),
+    )
+
+    mock_collection.query.assert_called_once()
+    mock_async_client.__aenter__.return_value.post.assert_called_once()
+    assert first["answer"] == second["answer"] == "This is a test answer."
+    assert first["request_id"] != second["request_id"]
+
+    log_entries = [call.args[0] for call in mock_log_request.call_args_list]
+    assert [entry.coalesced for entry in log_entries] == [False, True]
+    assert log_entries[0].coalesced_with is None
+    assert log_entries[1].coalesced_with == str(log_entries[0].request_id)
+    # The pipeline cost is counted once, on the leader's row
+    assert log_entries[0].prompt_tokens > 0
+    assert log_entries[1].answer == log_entries[0].answer
+    assert log_entries[1].latency_ms_llm is None
+    assert log_entries[1].prompt_tokens is None
+    assert {str(entry.request_id) for entry in log_entries} == {first["request_id"], second["request_id"]}
+
+
+@pytest.mark.asyncio
+async def test_warmup_marks_index_and_model_ready(mocker):
+    """
+    Tests that a successful warm-up flips the readiness state reported by /ready.
+    """
+    mocker.patch.dict(readiness, {"index": False, "model": False})
+    mock_chroma_client = MagicMock()
+    mock_chroma_client.get_collection.return_value.count.return_value = 10
+    mocker.patch("chromadb.PersistentClient", return_value=mock_chroma_client)
+
+    mock_http_response = MagicMock()
+    mock_http_response.json.return_value = {"response": "", "load_duration": 1_000_000}
+    mock_async_client = AsyncMock()
+    mock_async_client.__aenter__.return_value.post = AsyncMock(return_value=mock_http_response)
+    mocker.patch("httpx.AsyncClient", return_value=mock_async_client)
+    mocker.patch("app.rag.query.logger")
+
+    warmup_index()
+    await warmup_model()
+
+    assert readiness == {"index": True, "model": True}
+
+
+@pytest.mark.asyncio
+async def test_warmup_until_ready_retries_after_failures(mocker):
+    """
+    Tests that the warm-up keeps retrying until the index exists and Ollama answers.
+    """
+    mocker.patch.dict(readiness, {"index": False, "model": False})
+    mock_chroma_client = MagicMock()
+    mock_collection = MagicMock()
+    mock_collection.count.return_value = 10
+    # The collection is missing on the first attempt and built before the second one
+    mock_chroma_client.get_collection.side_effect = [ValueError("Collection does not exist"), mock_collection]
+    mocker.patch("chromadb.PersistentClient", return_value=mock_chroma_client)
+
+    mock_http_response = MagicMock()
+    mock_http_response.json.return_value = {"response": ""}
+    mock_async_client = AsyncMock()
+    # Ollama is unreachable on the first two attempts
+    mock_async_client.__aenter__.return_value.post = AsyncMock(
+        side_effect=[httpx.ConnectError("refused"), httpx.ConnectError("refused"), mock_http_response]
+    )
+    mocker.patch("httpx.AsyncClient", return_value=mock_async_client)
+    mocker.patch("app.rag.query.logger")
+    mock_sleep = mocker.patch("app.rag.query.asyncio.sleep", new=AsyncMock())
+
+    await warmup_until_ready(initial_delay_s=1, max_delay_s=1.5)
+
+    assert readiness == {"index": True, "model": True}
+    assert mock_chroma_client.get_collection.call_count == 2
+    assert mock_async_client.__aenter__.return_value.post.call_count == 3
+    assert [call.args[0] for call in mock_sleep.call_args_list] == [1, 1.5]